@@ -1,16 +1,51 @@
 from __future__ import annotations
 
+import asyncio
+import hashlib
 import json
 import logging
+from collections import OrderedDict
 from contextlib import suppress
 from dataclasses import dataclass
 
-from httpx import AsyncClient, AsyncHTTPTransport
+from httpx import AsyncClient, AsyncHTTPTransport, Limits
 from openai import AsyncOpenAI
 from openai.types.responses import Response
 
 logger = logging.getLogger(__name__)
 
+HTTP_LIMITS = Limits(max_keepalive_connections=64, max_connections=128, keepalive_expiry=60)
+REWRITE_CACHE_SIZE = 4096
+
+SYSTEM_MESSAGE = {
+    "role": "system",
+    "content": [
+        {
+            "type": "input_text",
+            "text": "Ты редактор Telegram-канала с акцентом на короткий, чистый и продающий стиль.",
+        }
+    ],
+}
+REWRITE_PROMPT_TEMPLATE = """Перепиши текст объявления для Telegram в едином стиле. 
+Сохрани факты, цену, условия, контакты по смыслу. 
+Не добавляй вымышленные данные. Верни только итоговый текст поста без пояснений.
+
+СТРУКТУРА ОТВЕТА:
+- [название товара] (если есть)
+- Цена на МП: [цена без кэшбека] (если есть)
+- Цена с кэшбеком: [цена с кэшбеком] (если есть)
+- Кэшбек: [процент кэшбека]% (если есть)
+- [условия заказа + ссылка на аккаунт в телеграме] (если есть)
+
+ФОРМАТ ОТВЕТА:
+Если отсутствует какой-то из пунктов, то не включай его в ответ. 
+Итоговый текст напиши по шаблону,можешь добавить несколько эмодзи и смайликов.
+Если итоговый кэшбек для покупателя > 50%, то выдели его жирным и поставь 🔥 
+
+Исходный текст:
+{original_text}
+"""
+
 
 @dataclass(slots=True)
 class OpenAIConfig:
@@ -18,6 +53,7 @@ class OpenAIConfig:
     model: str 
     proxy: str 
     timeout_seconds: float = 30.0
+    concurrency: int = 8
 
 
 class OpenAIGateway:
@@ -26,16 +62,34 @@ class OpenAIGateway:
             api_key=config.openai_api_key,
             http_client=AsyncClient(
                 proxy=config.proxy,
-                transport=AsyncHTTPTransport(local_address="0.0.0.0"),
+                http2=True,
+                limits=HTTP_LIMITS,
+                transport=AsyncHTTPTransport(
+                    local_address="0.0.0.0",
+                    http2=True,
+                    limits=HTTP_LIMITS,
+                ),
                 timeout=config.timeout_seconds,
             ),
         )
         self._model = config.model
+        self._sem = asyncio.Semaphore(max(1, config.concurrency))
+        self._cache: OrderedDict[bytes, str] = OrderedDict()
+        self._inflight: dict[bytes, asyncio.Future[str | None]] = {}
 
+    async def aclose(self) -> None:
+        await self._client.close()
 
     @staticmethod
     def _extract_response_text(response: Response) -> str | None:
         """Извлекает текст ответа из response объекта OpenAI"""
+        try:
+            text = response.output[0].content[0].text
+        except (IndexError, AttributeError, TypeError):
+            text = None
+        if text:
+            return text.strip()
+
         for item in response.output:
             if getattr(item, "content", None):
                 for block in item.content:
@@ -45,54 +99,52 @@ class OpenAIGateway:
         return None
 
     async def rewrite_offer(self, original_text: str) -> str:
-        prompt = f"""
-            Перепиши текст объявления для Telegram в едином стиле. 
-            Сохрани факты, цену, условия, контакты по смыслу. 
-            Не добавляй вымышленные данные. Верни только итоговый текст поста без пояснений.
-            
-            СТРУКТУРА ОТВЕТА:
-            - [название товара] (если есть)
-            - Цена на МП: [цена без кэшбека] (если есть)
-            - Цена с кэшбеком: [цена с кэшбеком] (если есть)
-            - Кэшбек: [процент кэшбека]% (если есть)
-            - [условия заказа + ссылка на аккаунт в телеграме] (если есть)
-            
-            ФОРМАТ ОТВЕТА:
-            Если отсутствует какой-то из пунктов, то не включай его в ответ. 
-            Итоговый текст напиши по шаблону,можешь добавить несколько эмодзи и смайликов.
-            Если итоговый кэшбек для покупателя > 50%, то выдели его жирным и поставь 🔥 
-            
-            Исходный текст:
-            {original_text}
-        """
-      
+        key = hashlib.blake2b(original_text.encode("utf-8"), digest_size=16).digest()
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            logger.info("OpenAI rewrite cache hit")
+            return cached
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending) or original_text
+
+        request = asyncio.ensure_future(self._request_rewrite(original_text))
+        self._inflight[key] = request
+        request.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # Shielded so that cancelling the first caller does not cancel the waiting ones
+        rewritten = await asyncio.shield(request)
+
+        if not rewritten:
+            return original_text
+        self._cache[key] = rewritten
+        if len(self._cache) > REWRITE_CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return rewritten
+
+    async def _request_rewrite(self, original_text: str) -> str | None:
+        prompt = REWRITE_PROMPT_TEMPLATE.format(original_text=original_text)
         try:
-            response = await self._client.responses.create(
-                model=self._model,
-                input=[
-                    {
-                        "role": "system",
-                        "content": [
-                            {
-                                "type": "input_text",
-                                "text": "Ты редактор Telegram-канала с акцентом на короткий, чистый и продающий стиль.",
-                            }
-                        ],
-                    },
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "input_text", 
-                                "text": prompt
-                            }
-                        ],
-                    },
-                ]
-            )
+            async with self._sem:
+                response = await self._client.responses.create(
+                    model=self._model,
+                    input=[
+                        SYSTEM_MESSAGE,
+                        {
+                            "role": "user",
+                            "content": [
+                                {
+                                    "type": "input_text", 
+                                    "text": prompt
+                                }
+                            ],
+                        },
+                    ]
+                )
             rewritten = self._extract_response_text(response)
             if not rewritten:
-                return original_text
+                return None
 
             logger.info("OpenAI rewrite success")
             return rewritten
@@ -100,4 +152,15 @@ class OpenAIGateway:
             logger.warning("OpenAI rewrite failed: %s", exc)
             with suppress(Exception):
                 logger.debug("OpenAI error payload: %s", json.dumps({"error": str(exc)}))
-            return original_text
\ No newline at end of file
+            return None
+
+    async def rewrite_offers(self, texts: list[str]) -> list[str]:
+        """Переписывает пачку объявлений параллельно, сохраняя порядок"""
+        results = await asyncio.gather(
+            *(self.rewrite_offer(text) for text in texts),
+            return_exceptions=True,
+        )
+        return [
+            text if isinstance(result, BaseException) else result
+            for text, result in zip(texts, results, strict=True)
+        ]
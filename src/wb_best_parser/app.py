@@ -3,11 +3,13 @@ from __future__ import annotations
 import asyncio
 import json
 import logging
-import tempfile
+from collections.abc import Mapping
 from contextlib import suppress
 from dataclasses import dataclass
 from datetime import UTC, datetime, timedelta
+from functools import lru_cache
 from pathlib import Path
+from types import MappingProxyType
 from typing import Any
 from zoneinfo import ZoneInfo
 
@@ -17,30 +19,41 @@ from telethon.utils import get_peer_id
 from infrastructure.openai import OpenAIConfig, OpenAIGateway
 from wb_best_parser.config import Settings, get_settings
 from wb_best_parser.constants import (
+    AI_MIN_CHARS,
+    AI_MIN_WORDS,
     BACKFILL_HOURS,
     BACKFILL_LIMIT_PER_CHAT,
     BLACKLISTED_TG_ACCOUNTS_LIST,
     CACHED_SCORE_THRESHOLD,
+    DEDUP_FLUSH_EVERY,
+    DEDUP_FLUSH_INTERVAL_SECONDS,
     DEDUP_MAX_ITEMS,
     DEDUP_MEDIA,
     DEDUP_STORE_FILE,
+    DISCOUNT_SCORE_TIERS,
     DRY_RUN,
     EVENING_PEAK_END_HOUR,
     EVENING_PEAK_INTERVAL_MINUTES,
     EVENING_PEAK_START_HOUR,
     EXCLUDE_KEYWORDS_LIST,
     INCLUDE_KEYWORDS_LIST,
+    MEDIA_SPOOL_DIR,
+    MESSAGE_QUEUE_MAXSIZE,
     MIN_SCORE,
+    OPENAI_CONCURRENCY,
     OPENAI_MODEL,
+    PRICE_SCORE_TIERS,
     PUBLISH_TOP_N,
     QUIET_END_HOUR,
     QUIET_START_HOUR,
     REWRITE_WITH_AI,
     SCHEDULE_TIMEZONE,
+    SOURCE_RESOLVE_CONCURRENCY,
     TOP_CACHE_HASHES_FILE,
     TOP_CACHE_ITEMS_FILE,
     TOP_CACHE_MAX_ITEMS,
     TOP_WINDOW_MINUTES,
+    WORKER_CONCURRENCY,
 )
 from wb_best_parser.dedup import DedupStore
 from wb_best_parser.filters import OfferFilter
@@ -53,6 +66,13 @@ logger = logging.getLogger("wb_best_parser")
 MEDIA_CAPTION_LIMIT = 1024
 
 
+def should_rewrite(text: str) -> bool:
+    if len(text) < AI_MIN_CHARS:
+        return False
+    return "\n" in text or len(text.split(maxsplit=AI_MIN_WORDS)) > AI_MIN_WORDS
+
+
+@lru_cache(maxsize=16)
 def ensure_session_path(session_name: str) -> str:
     session_path = Path(session_name)
     if session_path.parent and str(session_path.parent) != ".":
@@ -71,7 +91,7 @@ async def run(settings: Settings) -> None:
             exc,
         )
         file_sources = []
-    source_chats = file_sources or settings.source_chats_list()
+    source_chats = file_sources or list(settings.source_chats)
 
     if not source_chats:
         raise ValueError(
@@ -102,10 +122,14 @@ async def run(settings: Settings) -> None:
         exclude_keywords=EXCLUDE_KEYWORDS_LIST,
         min_score=MIN_SCORE,
         blacklisted_accounts=BLACKLISTED_TG_ACCOUNTS_LIST,
+        price_tiers=PRICE_SCORE_TIERS,
+        discount_tiers=DISCOUNT_SCORE_TIERS,
     )
     dedup_store = DedupStore(
         path=DEDUP_STORE_FILE,
         max_items=DEDUP_MAX_ITEMS,
+        flush_every=DEDUP_FLUSH_EVERY,
+        flush_interval=DEDUP_FLUSH_INTERVAL_SECONDS,
     )
     top_cache_store = DedupStore(
         path=TOP_CACHE_HASHES_FILE,
@@ -120,6 +144,7 @@ async def run(settings: Settings) -> None:
                 openai_api_key=settings.openai_api_key,
                 model=OPENAI_MODEL,
                 proxy=settings.openai_proxy,
+                concurrency=OPENAI_CONCURRENCY,
             )
         )
         logger.info("AI rewrite is enabled (%s)", OPENAI_MODEL)
@@ -131,8 +156,9 @@ async def run(settings: Settings) -> None:
         message: Any
         source_title: str
         score: int
-        reasons: list[str]
+        reasons: tuple[str, ...]
         original_text: str
+        normalized_text: str
         created_at: datetime
 
     @dataclass(slots=True)
@@ -146,10 +172,15 @@ async def run(settings: Settings) -> None:
         original_text: str
         created_at: str
 
-    source_entity_cache: dict[int, str] = {}
-    source_entity_lookup: dict[int, Any] = {}
+    source_entity_cache: Mapping[int, str] = MappingProxyType({})
+    source_entity_lookup: Mapping[int, Any] = MappingProxyType({})
     top_cached_candidates: list[CachedCandidate] = []
     top_cache_items_path = Path(TOP_CACHE_ITEMS_FILE)
+    media_spool_dir = Path(MEDIA_SPOOL_DIR)
+    media_spool_dir.mkdir(parents=True, exist_ok=True)
+    for stale_media in media_spool_dir.iterdir():
+        with suppress(OSError):
+            stale_media.unlink()
     top_mode_enabled = PUBLISH_TOP_N > 0
     base_window_seconds = max(60, TOP_WINDOW_MINUTES * 60)
     evening_peak_window_seconds = max(60, EVENING_PEAK_INTERVAL_MINUTES * 60)
@@ -157,31 +188,45 @@ async def run(settings: Settings) -> None:
 
     def parse_channel_id(raw_source: str) -> int | None:
         raw = raw_source.strip()
-        if not raw or not raw.startswith("-100"):
+        if not raw.startswith("-100"):
             return None
         suffix = raw[4:]
-        return int(suffix) if suffix.isdigit() else None
+        return int(suffix) if suffix.isdecimal() else None
 
     async def resolve_sources(raw_sources: list[str]) -> tuple[list, list[str]]:
+        nonlocal source_entity_cache, source_entity_lookup
         resolved_entities = []
         resolved_titles = []
-        dialogs_cache = None
+        titles_by_id: dict[int, str] = {}
+        entities_by_id: dict[int, Any] = {}
+        dialogs_by_id: dict[int, Any] | None = None
+        resolve_sem = asyncio.Semaphore(SOURCE_RESOLVE_CONCURRENCY)
 
-        for raw_source in raw_sources:
-            try:
+        async def resolve_one(raw_source: str):
+            async with resolve_sem:
                 input_entity = await client.get_input_entity(raw_source)
-                entity = await client.get_entity(input_entity)
-            except Exception:
+                return await client.get_entity(input_entity)
+
+        results = await asyncio.gather(
+            *(resolve_one(raw_source) for raw_source in raw_sources),
+            return_exceptions=True,
+        )
+
+        for raw_source, result in zip(raw_sources, results, strict=True):
+            if not isinstance(result, BaseException):
+                entity = result
+            else:
                 entity = None
                 channel_id = parse_channel_id(raw_source)
                 if channel_id is not None:
-                    if dialogs_cache is None:
-                        dialogs_cache = [d async for d in client.iter_dialogs()]
-                    for dialog in dialogs_cache:
-                        dialog_entity = getattr(dialog, "entity", None)
-                        if getattr(dialog_entity, "id", None) == channel_id:
-                            entity = dialog_entity
-                            break
+                    if dialogs_by_id is None:
+                        dialogs_by_id = {}
+                        async for dialog in client.iter_dialogs():
+                            dialog_entity = getattr(dialog, "entity", None)
+                            dialog_id = getattr(dialog_entity, "id", None)
+                            if isinstance(dialog_id, int):
+                                dialogs_by_id.setdefault(dialog_id, dialog_entity)
+                    entity = dialogs_by_id.get(channel_id)
 
                 if entity is None:
                     logger.warning("Skip source %s: cannot resolve entity", raw_source)
@@ -193,15 +238,17 @@ async def run(settings: Settings) -> None:
 
             chat_id = getattr(entity, "id", None)
             if isinstance(chat_id, int):
-                source_entity_cache[chat_id] = title
-                source_entity_lookup[chat_id] = entity
+                titles_by_id[chat_id] = title
+                entities_by_id[chat_id] = entity
             try:
                 peer_id = get_peer_id(entity)
-                source_entity_cache[peer_id] = title
-                source_entity_lookup[peer_id] = entity
+                titles_by_id[peer_id] = title
+                entities_by_id[peer_id] = entity
             except Exception:
                 pass
 
+        source_entity_cache = MappingProxyType(titles_by_id)
+        source_entity_lookup = MappingProxyType(entities_by_id)
         return resolved_entities, resolved_titles
 
     async def publish_message(message, composed_text: str, downloaded_media: str | None) -> None:
@@ -220,78 +267,82 @@ async def run(settings: Settings) -> None:
         else:
             await client.send_message(settings.target_chat, composed_text)
 
+    async def download_to_spool(message) -> str | None:
+        target = media_spool_dir / f"{message.chat_id}_{message.id}"
+        downloaded = await client.download_media(message, file=str(target))
+        return downloaded if isinstance(downloaded, str) else None
+
+    def discard_spooled(path: str | None) -> None:
+        if path:
+            with suppress(OSError):
+                Path(path).unlink(missing_ok=True)
+
     async def publish_with_dedup(
         message,
         source_title: str,
-        composed_text: str,
+        original_text: str,
         score: int,
-        reasons: list[str],
-        dedup_text: str | None = None,
+        reasons: tuple[str, ...],
+        normalized_text: str | None = None,
+        composed_text: str | None = None,
     ) -> bool:
-        dedup_base_text = dedup_text if dedup_text is not None else composed_text
-        text_fingerprint = DedupStore.fingerprint(dedup_base_text)
+        text_fingerprint = DedupStore.fingerprint(original_text, normalized=normalized_text)
         media_fingerprint: str | None = None
-        media_temp_dir: tempfile.TemporaryDirectory[str] | None = None
         downloaded_media: str | None = None
 
-        if message.media:
-            media_temp_dir = tempfile.TemporaryDirectory()
-            downloaded = await client.download_media(message, file=media_temp_dir.name)
-            if isinstance(downloaded, str):
-                downloaded_media = downloaded
-                if DEDUP_MEDIA:
+        try:
+            if message.media:
+                downloaded_media = await download_to_spool(message)
+                if downloaded_media and DEDUP_MEDIA:
                     try:
-                        media_bytes = Path(downloaded_media).read_bytes()
-                        raw_hash = DedupStore.fingerprint_bytes(media_bytes)
+                        raw_hash = DedupStore.fingerprint_stream(downloaded_media)
                         media_fingerprint = f"img:{raw_hash}" if raw_hash else None
                     except OSError as exc:
                         logger.warning("Failed to hash media for message %s: %s", message.id, exc)
 
-        dedup_keys: list[str] = []
-        if text_fingerprint:
-            dedup_keys.append(f"txt:{text_fingerprint}")
-        if media_fingerprint:
-            dedup_keys.append(media_fingerprint)
+            dedup_keys: list[str] = []
+            if text_fingerprint:
+                dedup_keys.append(f"txt:{text_fingerprint}")
+            if media_fingerprint:
+                dedup_keys.append(media_fingerprint)
 
-        reserved_keys: list[str] = []
-        if dedup_keys:
-            async with dedup_lock:
-                duplicate_key = next((key for key in dedup_keys if dedup_store.contains(key)), None)
-                if duplicate_key:
-                    logger.info(
-                        "Skip duplicate post from %s (message_id=%s, key=%s)",
-                        source_title,
-                        message.id,
-                        duplicate_key,
-                    )
-                    if media_temp_dir:
-                        media_temp_dir.cleanup()
-                    return False
-                for key in dedup_keys:
-                    dedup_store.add(key)
-                    reserved_keys.append(key)
-                dedup_store.flush()
-
-        if DRY_RUN:
-            logger.info("[DRY_RUN] matched from %s: %s", source_title, composed_text[:250])
-            if media_temp_dir:
-                media_temp_dir.cleanup()
-            return True
-
-        try:
-            await publish_message(message, composed_text, downloaded_media)
-        except Exception:
-            if reserved_keys:
+            reserved_keys: list[str] = []
+            if dedup_keys:
                 async with dedup_lock:
-                    for key in reserved_keys:
-                        dedup_store.remove(key)
-                    dedup_store.flush()
-            if media_temp_dir:
-                media_temp_dir.cleanup()
-            raise
+                    duplicate_key = next((key for key in dedup_keys if dedup_store.contains(key)), None)
+                    if duplicate_key:
+                        logger.info(
+                            "Skip duplicate post from %s (message_id=%s, key=%s)",
+                            source_title,
+                            message.id,
+                            duplicate_key,
+                        )
+                        return False
+                    for key in dedup_keys:
+                        dedup_store.add(key)
+                        reserved_keys.append(key)
+                    dedup_store.flush_if_due()
+
+            try:
+                if composed_text is None:
+                    composed_text = original_text
+                    if openai_gateway and should_rewrite(composed_text):
+                        composed_text = await openai_gateway.rewrite_offer(composed_text)
+
+                if DRY_RUN:
+                    logger.info("[DRY_RUN] matched from %s: %s", source_title, composed_text[:250])
+                    return True
+
+                await publish_message(message, composed_text, downloaded_media)
+            except BaseException:
+                if reserved_keys:
+                    async with dedup_lock:
+                        for key in reserved_keys:
+                            dedup_store.remove(key)
+                        dedup_store.flush_if_due()
+                raise
         finally:
-            if media_temp_dir:
-                media_temp_dir.cleanup()
+            discard_spooled(downloaded_media)
 
         logger.info(
             "Published from %s (message_id=%s, score=%s, reasons=%s)",
@@ -303,38 +354,32 @@ async def run(settings: Settings) -> None:
         return True
 
     async def is_candidate_duplicate(candidate: Candidate) -> bool:
-        text_fingerprint = DedupStore.fingerprint(candidate.original_text)
+        text_fingerprint = DedupStore.fingerprint(candidate.original_text, normalized=candidate.normalized_text)
         text_key = f"txt:{text_fingerprint}" if text_fingerprint else None
         media_key: str | None = None
-        media_temp_dir: tempfile.TemporaryDirectory[str] | None = None
 
         if candidate.message.media and DEDUP_MEDIA:
-            media_temp_dir = tempfile.TemporaryDirectory()
-            downloaded = await client.download_media(candidate.message, file=media_temp_dir.name)
-            if isinstance(downloaded, str):
-                try:
-                    media_bytes = Path(downloaded).read_bytes()
-                    media_hash = DedupStore.fingerprint_bytes(media_bytes)
+            downloaded = await download_to_spool(candidate.message)
+            try:
+                if downloaded:
+                    media_hash = DedupStore.fingerprint_stream(downloaded)
                     media_key = f"img:{media_hash}" if media_hash else None
-                except OSError as exc:
-                    logger.warning(
-                        "Failed to hash media for duplicate pre-check message %s: %s",
-                        candidate.message.id,
-                        exc,
-                    )
+            except OSError as exc:
+                logger.warning(
+                    "Failed to hash media for duplicate pre-check message %s: %s",
+                    candidate.message.id,
+                    exc,
+                )
+            finally:
+                discard_spooled(downloaded)
 
         dedup_keys = [key for key in (text_key, media_key) if key]
         if not dedup_keys:
-            if media_temp_dir:
-                media_temp_dir.cleanup()
             return False
 
         async with dedup_lock:
             duplicate_key = next((key for key in dedup_keys if dedup_store.contains(key)), None)
 
-        if media_temp_dir:
-            media_temp_dir.cleanup()
-
         if duplicate_key:
             logger.info(
                 "Top mode skip before rewrite: duplicate key=%s for message_id=%s from %s",
@@ -353,7 +398,8 @@ async def run(settings: Settings) -> None:
 
     async def build_candidate(message, source_title: str) -> Candidate | None:
         text = message.message or ""
-        result = offer_filter.match(text)
+        normalized_text = text.lower()
+        result = offer_filter.match(text, normalized=normalized_text)
 
         if not result.is_interesting:
             logger.debug("Skip message %s, score=%s", message.id, result.score)
@@ -366,21 +412,19 @@ async def run(settings: Settings) -> None:
             score=result.score,
             reasons=result.reasons,
             original_text=text.strip(),
+            normalized_text=normalized_text,
             created_at=created_at,
         )
 
-    async def publish_candidate(candidate: Candidate) -> bool:
-        composed_text = candidate.original_text
-        if openai_gateway and composed_text:
-            composed_text = await openai_gateway.rewrite_offer(composed_text)
-
+    async def publish_candidate(candidate: Candidate, composed_text: str | None = None) -> bool:
         return await publish_with_dedup(
             message=candidate.message,
             source_title=candidate.source_title,
-            composed_text=composed_text,
+            original_text=candidate.original_text,
             score=candidate.score,
             reasons=candidate.reasons,
-            dedup_text=candidate.original_text,
+            normalized_text=candidate.normalized_text,
+            composed_text=composed_text,
         )
 
     def candidate_cache_key(candidate: Candidate) -> str | None:
@@ -394,7 +438,7 @@ async def run(settings: Settings) -> None:
         if isinstance(peer_id, int) and isinstance(message_id, int):
             return f"msg:{peer_id}:{message_id}"
 
-        text_fingerprint = DedupStore.fingerprint(candidate.original_text)
+        text_fingerprint = DedupStore.fingerprint(candidate.original_text, normalized=candidate.normalized_text)
         if text_fingerprint:
             return f"txt:{text_fingerprint}"
         return None
@@ -437,7 +481,7 @@ async def run(settings: Settings) -> None:
 
         loaded: list[CachedCandidate] = []
         try:
-            lines = top_cache_items_path.read_text(encoding="utf-8").splitlines()
+            lines = top_cache_items_path.read_bytes().splitlines()
         except OSError as exc:
             logger.warning("Top cache load failed (%s): %s", top_cache_items_path, exc)
             return []
@@ -447,7 +491,7 @@ async def run(settings: Settings) -> None:
                 continue
             try:
                 payload = json.loads(line)
-            except json.JSONDecodeError:
+            except (json.JSONDecodeError, UnicodeDecodeError):
                 continue
 
             if not isinstance(payload, dict):
@@ -549,8 +593,9 @@ async def run(settings: Settings) -> None:
             message=cached_message,
             source_title=cached.source_title,
             score=cached.score,
-            reasons=list(cached.reasons),
+            reasons=tuple(cached.reasons),
             original_text=original_text,
+            normalized_text=original_text.lower(),
             created_at=created_at,
         )
 
@@ -624,16 +669,11 @@ async def run(settings: Settings) -> None:
         return False
 
     def source_title_for_entity(entity) -> str:
-        title = getattr(entity, "title", None) or str(getattr(entity, "id", "unknown"))
-        entity_id = getattr(entity, "id", None)
-        if isinstance(entity_id, int):
-            source_entity_cache[entity_id] = title
-            source_entity_lookup[entity_id] = entity
         with suppress(Exception):
-            peer_id = get_peer_id(entity)
-            source_entity_cache[peer_id] = title
-            source_entity_lookup[peer_id] = entity
-        return title
+            title = source_entity_cache.get(get_peer_id(entity))
+            if title:
+                return title
+        return getattr(entity, "title", None) or str(getattr(entity, "id", "unknown"))
 
     def select_top_candidates(candidates: list[Candidate], limit: int | None = None) -> list[Candidate]:
         candidates.sort(
@@ -654,12 +694,22 @@ async def run(settings: Settings) -> None:
             return
         await publish_candidate(candidate)
 
+    message_queue: asyncio.Queue[tuple[Any, str]] = asyncio.Queue(maxsize=MESSAGE_QUEUE_MAXSIZE)
+
+    async def message_worker() -> None:
+        while True:
+            message, source_title = await message_queue.get()
+            try:
+                await process_message_immediate(message, source_title)
+            except Exception:
+                logger.exception("Failed to process message %s from %s", message.id, source_title)
+            finally:
+                message_queue.task_done()
+
     async def on_new_message(event: events.NewMessage.Event) -> None:
-        chat = await event.get_chat()
         chat_id = event.chat_id or 0
-        if chat_id not in source_entity_cache:
-            source_entity_cache[chat_id] = getattr(chat, "title", None) or str(chat_id)
-        await process_message_immediate(event.message, source_entity_cache[chat_id])
+        source_title = source_entity_cache.get(chat_id) or str(chat_id)
+        await message_queue.put((event.message, source_title))
 
     async def process_backfill(resolved_entities: list) -> None:
         if BACKFILL_HOURS <= 0:
@@ -684,8 +734,42 @@ async def run(settings: Settings) -> None:
                     break
                 recent_messages.append(msg)
 
+            batch: list[Candidate] = []
             for msg in reversed(recent_messages):
-                await process_message_immediate(msg, source_title)
+                candidate = await build_candidate(msg, source_title)
+                if candidate:
+                    batch.append(candidate)
+
+            text_fingerprints = DedupStore.fingerprint_many(
+                [candidate.original_text for candidate in batch],
+                normalized=[candidate.normalized_text for candidate in batch],
+            )
+            async with dedup_lock:
+                duplicate_flags = [
+                    bool(fingerprint) and dedup_store.contains(f"txt:{fingerprint}")
+                    for fingerprint in text_fingerprints
+                ]
+            fresh_batch: list[Candidate] = []
+            for candidate, is_duplicate in zip(batch, duplicate_flags, strict=True):
+                if is_duplicate:
+                    logger.info(
+                        "Skip duplicate post from %s before rewrite (message_id=%s)",
+                        source_title,
+                        candidate.message.id,
+                    )
+                    continue
+                fresh_batch.append(candidate)
+            batch = fresh_batch
+
+            composed_texts = [candidate.original_text for candidate in batch]
+            if openai_gateway and batch:
+                rewritable = [index for index, text in enumerate(composed_texts) if should_rewrite(text)]
+                rewritten = await openai_gateway.rewrite_offers([composed_texts[index] for index in rewritable])
+                for index, text in zip(rewritable, rewritten, strict=True):
+                    composed_texts[index] = text
+
+            for candidate, composed_text in zip(batch, composed_texts, strict=True):
+                await publish_candidate(candidate, composed_text)
 
             logger.info(
                 "Backfill checked %s message(s) for %s",
@@ -817,6 +901,15 @@ async def run(settings: Settings) -> None:
 
         logger.info("Top mode flush (%s): all fresh+cache candidates are duplicates, nothing published", reason)
 
+    async def dedup_flush_loop() -> None:
+        while True:
+            await asyncio.sleep(DEDUP_FLUSH_INTERVAL_SECONDS)
+            async with dedup_lock:
+                try:
+                    dedup_store.flush_if_due()
+                except OSError as exc:
+                    logger.warning("Dedup store flush failed (%s): %s", dedup_store.path, exc)
+
     async def top_mode_loop(resolved_entities: list) -> None:
         if not top_mode_enabled:
             return
@@ -897,18 +990,34 @@ async def run(settings: Settings) -> None:
 
     logger.info("Starting parser. Listening channels: %s", ", ".join(resolved_titles))
     top_task: asyncio.Task[None] | None = None
-    if top_mode_enabled:
-        top_task = asyncio.create_task(top_mode_loop(resolved_entities))
-    else:
-        client.add_event_handler(on_new_message, events.NewMessage(chats=resolved_entities))
-        await process_backfill(resolved_entities)
+    worker_tasks: list[asyncio.Task[None]] = []
+    flush_task: asyncio.Task[None] | None = None
     try:
+        flush_task = asyncio.create_task(dedup_flush_loop())
+        if top_mode_enabled:
+            top_task = asyncio.create_task(top_mode_loop(resolved_entities))
+        else:
+            worker_tasks = [asyncio.create_task(message_worker()) for _ in range(max(1, WORKER_CONCURRENCY))]
+            client.add_event_handler(on_new_message, events.NewMessage(chats=resolved_entities))
+            await process_backfill(resolved_entities)
         await client.run_until_disconnected()
     finally:
         if top_task:
             top_task.cancel()
             with suppress(asyncio.CancelledError):
                 await top_task
+        for worker_task in worker_tasks:
+            worker_task.cancel()
+        for worker_task in worker_tasks:
+            with suppress(asyncio.CancelledError):
+                await worker_task
+        if flush_task:
+            flush_task.cancel()
+            with suppress(asyncio.CancelledError):
+                await flush_task
+        dedup_store.flush()
+        if openai_gateway:
+            await openai_gateway.aclose()
 
 
 def main() -> None:
@@ -1,81 +1,95 @@
 from __future__ import annotations
 
 import errno
+import os
 import time
+from dataclasses import dataclass
 from functools import lru_cache
 from pathlib import Path
 
-from pydantic import Field, field_validator, model_validator
-from pydantic_settings import BaseSettings, SettingsConfigDict
+from dotenv import dotenv_values
 
+from wb_best_parser.constants import parse_csv
 
-class Settings(BaseSettings):
-    model_config = SettingsConfigDict(
-        env_file=".env",
-        env_file_encoding="utf-8",
-        extra="ignore",
-    )
+ENV_FILE = ".env"
 
-    tg_api_id: int = Field(alias="TG_API_ID")
-    tg_api_hash: str = Field(alias="TG_API_HASH")
-    tg_session: str = Field(default="sessions/user", alias="TG_SESSION")
-    targets_file: str = Field(default="targets.txt", alias="TARGETS_FILE")
-    
-    proxy_username: str = Field(alias="PROXY_USERNAME")
-    proxy_password: str = Field(alias="PROXY_PASSWORD")
-    
-    source_chats: str = Field(default="", alias="SOURCE_CHATS")
-    target_chat: str = Field(alias="TARGET_CHAT")
 
-    openai_api_key: str = Field(default="", alias="OPENAI_API_KEY")
-    openai_proxy: str = Field(default="", alias="OPENAI_PROXY")
+def _load_env(path: str = ENV_FILE) -> dict[str, str]:
+    # Process environment wins over .env and names are case-insensitive, same as before
+    values = {
+        key.upper(): value for key, value in dotenv_values(path, encoding="utf-8").items() if value is not None
+    }
+    values.update((key.upper(), value) for key, value in os.environ.items())
+    return values
 
-    @field_validator("target_chat", mode="before")
-    @classmethod
-    def normalize_target_chat(cls, value: str) -> str:
-        return value.strip() if isinstance(value, str) else value
 
-    @staticmethod
-    def parse_csv(value: str) -> list[str]:
-        if not value:
-            return []
-        return [item.strip() for item in value.split(",") if item.strip()]
+def _require(env: dict[str, str], key: str) -> str:
+    value = env.get(key)
+    if value is None:
+        raise ValueError(f"{key} must be set")
+    return value
+
+
+@dataclass(slots=True, frozen=True)
+class Settings:
+    tg_api_id: int
+    tg_api_hash: str
+    tg_session: str
+    targets_file: str
+
+    proxy_username: str
+    proxy_password: str
 
-    def source_chats_list(self) -> list[str]:
-        return self.parse_csv(self.source_chats)
+    source_chats: tuple[str, ...]
+    target_chat: str
+
+    openai_api_key: str
+    openai_proxy: str
 
     def load_source_chats_from_file(self) -> list[str]:
         path = Path(self.targets_file)
         if not path.exists():
             return []
 
-        lines: list[str] = []
         for attempt in range(3):
             try:
                 with path.open("r", encoding="utf-8") as f:
-                    lines = f.readlines()
-                break
+                    return [value for line in f if (value := line.strip()) and not value.startswith("#")]
             except OSError as exc:
                 if exc.errno == errno.EDEADLK and attempt < 2:
                     time.sleep(0.2 * (attempt + 1))
                     continue
                 raise
+        return []
+
+    @classmethod
+    def from_env(cls, path: str = ENV_FILE) -> Settings:
+        env = _load_env(path)
 
-        chats: list[str] = []
-        for line in lines:
-            value = line.strip()
-            if not value or value.startswith("#"):
-                continue
-            chats.append(value)
-        return chats
-
-    @model_validator(mode="after")
-    def validate_required(self) -> Settings:
-        if not self.target_chat:
+        raw_api_id = _require(env, "TG_API_ID")
+        try:
+            tg_api_id = int(raw_api_id)
+        except ValueError:
+            raise ValueError(f"TG_API_ID must be an integer, got {raw_api_id!r}") from None
+
+        target_chat = _require(env, "TARGET_CHAT").strip()
+        if not target_chat:
             raise ValueError("TARGET_CHAT must be set")
-        return self
+
+        return cls(
+            tg_api_id=tg_api_id,
+            tg_api_hash=_require(env, "TG_API_HASH"),
+            tg_session=env.get("TG_SESSION", "sessions/user"),
+            targets_file=env.get("TARGETS_FILE", "targets.txt"),
+            proxy_username=_require(env, "PROXY_USERNAME"),
+            proxy_password=_require(env, "PROXY_PASSWORD"),
+            source_chats=tuple(parse_csv(env.get("SOURCE_CHATS", ""))),
+            target_chat=target_chat,
+            openai_api_key=env.get("OPENAI_API_KEY", ""),
+            openai_proxy=env.get("OPENAI_PROXY", ""),
+        )
 
 
 @lru_cache(maxsize=1)
 def get_settings() -> Settings:
-    return Settings()
+    return Settings.from_env()
@@ -3,12 +3,28 @@ from __future__ import annotations
 # AI and runtime behavior
 OPENAI_MODEL = "gpt-5.2"
 REWRITE_WITH_AI = True
+OPENAI_CONCURRENCY = 8
+# Short one-liners (a bare price tag) are published as is, without AI rewrite
+AI_MIN_CHARS = 40
+AI_MIN_WORDS = 5
 DRY_RUN = False
 
+# Live messages are queued and handled by a pool of workers
+WORKER_CONCURRENCY = 4
+MESSAGE_QUEUE_MAXSIZE = 256
+
+# Concurrent get_entity lookups while resolving targets on startup
+SOURCE_RESOLVE_CONCURRENCY = 8
+
 # Dedup settings
 DEDUP_MEDIA = True
 DEDUP_MAX_ITEMS = 10000
-DEDUP_STORE_FILE = "sessions/dedup_hashes.txt"
+DEDUP_STORE_FILE = "sessions/dedup_hashes.bin"
+# The dedup file is rewritten after this many changes or once this many seconds passed
+DEDUP_FLUSH_EVERY = 32
+DEDUP_FLUSH_INTERVAL_SECONDS = 2.0
+# Downloaded media lives here only until it is hashed and published
+MEDIA_SPOOL_DIR = "sessions/media_spool"
 
 # Filtering settings
 INCLUDE_KEYWORDS = "ВБ,МП,распродажа,скидка,кэшбек,️КЭШБЕК"
@@ -22,6 +38,22 @@ EXCLUDE_KEYWORDS = (
 BLACKLISTED_TG_ACCOUNTS = "ElviXari27,VegannovaBioherb"
 MIN_SCORE = 6
 
+# Score tiers: (lower bound inclusive, points, reason label).
+# The highest price in a post and its first discount each pick the last tier they reach.
+PRICE_SCORE_TIERS = (
+    (500, 1, "low_price"),
+    (1000, 2, "low_price"),
+    (1500, 3, "mid_price"),
+    (2500, 4, "big_price"),
+    (3500, 5, "biggest_price"),
+)
+DISCOUNT_SCORE_TIERS = (
+    (0, 1, "lowest_discount"),
+    (31, 2, "low_discount"),
+    (51, 3, "mid_discount"),
+    (81, 4, "big_discount"),
+)
+
 # Top mode schedule
 PUBLISH_TOP_N = 1
 TOP_WINDOW_MINUTES = 60
@@ -39,7 +71,7 @@ EVENING_PEAK_INTERVAL_MINUTES = 30
 # Carryover cache:
 # if there are no fresh posts with score > CACHED_SCORE_THRESHOLD, publish from cache first
 CACHED_SCORE_THRESHOLD = 5
-TOP_CACHE_HASHES_FILE = "sessions/top_cache_hashes.txt"
+TOP_CACHE_HASHES_FILE = "sessions/top_cache_hashes.bin"
 TOP_CACHE_ITEMS_FILE = "sessions/top_cache_items.jsonl"
 TOP_CACHE_MAX_ITEMS = 20000
 
@@ -50,6 +82,6 @@ def parse_csv(value: str) -> list[str]:
     return [item.strip() for item in value.split(",") if item.strip()]
 
 
-INCLUDE_KEYWORDS_LIST = parse_csv(INCLUDE_KEYWORDS)
-EXCLUDE_KEYWORDS_LIST = parse_csv(EXCLUDE_KEYWORDS)
-BLACKLISTED_TG_ACCOUNTS_LIST = parse_csv(BLACKLISTED_TG_ACCOUNTS)
+INCLUDE_KEYWORDS_LIST = tuple(parse_csv(INCLUDE_KEYWORDS))
+EXCLUDE_KEYWORDS_LIST = tuple(parse_csv(EXCLUDE_KEYWORDS))
+BLACKLISTED_TG_ACCOUNTS_LIST = tuple(parse_csv(BLACKLISTED_TG_ACCOUNTS))
@@ -1,70 +1,162 @@
 from __future__ import annotations
 
 import hashlib
-import re
+import time
 from collections import deque
+from collections.abc import Sequence
 from pathlib import Path
 
+import xxhash
+
+HASH_CHUNK_SIZE = 1 << 20
+# Keys are persisted as fixed-size xxh3_128 digests
+KEY_SIZE = 16
+
 
 class DedupStore:
-    def __init__(self, path: str, max_items: int = 5000) -> None:
+    def __init__(
+        self,
+        path: str,
+        max_items: int = 5000,
+        flush_every: int = 32,
+        flush_interval: float = 2.0,
+    ) -> None:
         self.path = Path(path)
         self.max_items = max_items
-        self._items: deque[str] = deque()
-        self._set: set[str] = set()
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self._items: deque[bytes] = deque()
+        self._set: set[bytes] = set()
+        self._pending_append: list[bytes] = []
+        # Deque slots left behind by remove(), counted per key until compaction
+        self._stale: dict[bytes, int] = {}
+        self._file_items = 0
+        self._needs_rewrite = False
         self._dirty = 0
+        self._last_flush = time.monotonic()
         self._load()
 
     @staticmethod
-    def fingerprint(text: str) -> str | None:
-        normalized = re.sub(r"\s+", " ", (text or "")).strip().lower()
+    def fingerprint(text: str, normalized: str | None = None) -> str | None:
+        if normalized is None:
+            normalized = (text or "").lower()
+        normalized = " ".join(normalized.split())
         if not normalized:
             return None
-        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+        return xxhash.xxh3_64_hexdigest(normalized.encode("utf-8"))
+
+    @staticmethod
+    def fingerprint_many(texts: Sequence[str], normalized: Sequence[str] | None = None) -> list[str | None]:
+        if normalized is None:
+            normalized = [(text or "").lower() for text in texts]
+        collapsed = [" ".join(value.split()) for value in normalized]
+        hexdigest = xxhash.xxh3_64_hexdigest
+        return [hexdigest(value.encode("utf-8")) if value else None for value in collapsed]
 
     @staticmethod
-    def fingerprint_bytes(payload: bytes) -> str | None:
-        if not payload:
+    def fingerprint_stream(path: str | Path) -> str | None:
+        digest = hashlib.sha256()
+        size = 0
+        with open(path, "rb", buffering=0) as f:
+            while chunk := f.read(HASH_CHUNK_SIZE):
+                digest.update(chunk)
+                size += len(chunk)
+        if not size:
             return None
-        return hashlib.sha256(payload).hexdigest()
+        return digest.hexdigest()
+
+    @staticmethod
+    def _digest(key: str) -> bytes:
+        return xxhash.xxh3_128_digest(key.encode("utf-8"))
 
     def _load(self) -> None:
         if not self.path.exists():
+            self._load_legacy()
             return
-        lines = [line.strip() for line in self.path.read_text(encoding="utf-8").splitlines()]
+        data = memoryview(self.path.read_bytes())
+        end = len(data) - len(data) % KEY_SIZE
+        # A torn trailing record would misalign appends, so compact on next flush
+        self._needs_rewrite = end != len(data)
+        self._file_items = end // KEY_SIZE
+        start = max(0, end - self.max_items * KEY_SIZE)
+        tail = [bytes(data[offset : offset + KEY_SIZE]) for offset in range(start, end, KEY_SIZE)]
+        self._items.extend(tail)
+        self._set.update(tail)
+
+    def _load_legacy(self) -> None:
+        # Stores written before the binary format kept one key per text line
+        legacy_path = self.path.with_suffix(".txt")
+        if legacy_path == self.path or not legacy_path.exists():
+            return
+        # txt: keys were sha256 based and can never match an xxh3 text fingerprint
+        lines = [
+            value
+            for line in legacy_path.read_text(encoding="utf-8").splitlines()
+            if (value := line.strip()) and not value.startswith("txt:")
+        ]
         for value in lines[-self.max_items :]:
-            if not value:
-                continue
-            self._items.append(value)
-            self._set.add(value)
+            self.add(value)
 
     def contains(self, key: str) -> bool:
-        return key in self._set
+        return self._digest(key) in self._set
 
     def add(self, key: str) -> None:
-        if key in self._set:
+        digest = self._digest(key)
+        if digest in self._set:
             return
 
-        self._items.append(key)
-        self._set.add(key)
+        self._items.append(digest)
+        self._set.add(digest)
+        self._pending_append.append(digest)
 
         while len(self._items) > self.max_items:
             removed = self._items.popleft()
-            self._set.discard(removed)
+            stale = self._stale.get(removed)
+            if stale:
+                self._stale[removed] = stale - 1
+            else:
+                self._set.discard(removed)
 
         self._dirty += 1
-        if self._dirty >= 25:
-            self.flush()
+        self.flush_if_due()
 
     def remove(self, key: str) -> None:
-        if key not in self._set:
+        digest = self._digest(key)
+        if digest not in self._set:
             return
-        self._set.discard(key)
-        self._items = deque(item for item in self._items if item != key)
+        self._set.discard(digest)
+        self._stale[digest] = self._stale.get(digest, 0) + 1
+        self._needs_rewrite = True
         self._dirty += 1
 
+    def flush_if_due(self) -> None:
+        if not self._dirty:
+            return
+        if self._dirty >= self.flush_every or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
     def flush(self) -> None:
         self.path.parent.mkdir(parents=True, exist_ok=True)
-        content = "\n".join(self._items)
-        self.path.write_text(f"{content}\n" if content else "", encoding="utf-8")
+        if self._needs_rewrite or self._file_items + len(self._pending_append) > 2 * self.max_items:
+            if self._stale:
+                # Stale slots always precede a live re-added slot of the same key
+                stale = self._stale
+                items: deque[bytes] = deque()
+                for item in self._items:
+                    count = stale.get(item)
+                    if count:
+                        stale[item] = count - 1
+                    else:
+                        items.append(item)
+                self._items = items
+                stale.clear()
+            self.path.write_bytes(b"".join(self._items))
+            self._file_items = len(self._items)
+            self._needs_rewrite = False
+        elif self._pending_append:
+            with self.path.open("ab") as f:
+                f.write(b"".join(self._pending_append))
+            self._file_items += len(self._pending_append)
+        self._pending_append.clear()
         self._dirty = 0
+        self._last_flush = time.monotonic()
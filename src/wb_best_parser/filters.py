@@ -1,112 +1,135 @@
 from __future__ import annotations
 
 import re
-from dataclasses import dataclass
+from bisect import bisect_right
+from collections.abc import Sequence
+from typing import NamedTuple
 
 
-@dataclass(slots=True)
-class MatchResult:
+def compile_keywords(keywords: Sequence[str]) -> re.Pattern[str] | None:
+    if not keywords:
+        return None
+    return re.compile("|".join(re.escape(keyword) for keyword in keywords))
+
+
+# (lower bound inclusive, points, reason label)
+ScoreTier = tuple[int, int, str]
+
+
+def split_tiers(tiers: Sequence[ScoreTier]) -> tuple[tuple[int, ...], tuple[int, ...], tuple[str, ...]]:
+    # Index 0 of points/labels stands for "below the first tier"
+    ordered = sorted(tiers)
+    thresholds = tuple(tier[0] for tier in ordered)
+    points = (0, *(tier[1] for tier in ordered))
+    labels = ("", *(tier[2] for tier in ordered))
+    return thresholds, points, labels
+
+
+class MatchResult(NamedTuple):
     is_interesting: bool
     score: int
-    reasons: list[str]
+    reasons: tuple[str, ...]
+
+
+EMPTY_TEXT_RESULT = MatchResult(is_interesting=False, score=0, reasons=("empty_text",))
+EXCLUDE_RESULT = MatchResult(is_interesting=False, score=0, reasons=("exclude_keyword",))
 
 
 class OfferFilter:
-    price_pattern = re.compile(r"(?:^|\D)(\d{2,7})\s?(?:₽|руб|р|RUB)(?:\D|$)", re.IGNORECASE)
-    discount_pattern = re.compile(
-        r"(?:(?:-|скидк\w*|к[еэ]шб[еэ]к\w*|cashback)\s*(?:до\s*)?)?(\d{1,2})\s?%",
-        re.IGNORECASE,
-    )
-    mention_account_pattern = re.compile(r"@([a-zA-Z0-9_]{5,32})")
-    tme_account_pattern = re.compile(r"(?:https?://)?(?:t|telegram)\.me/([a-zA-Z0-9_]{5,32})", re.IGNORECASE)
-    tg_domain_pattern = re.compile(r"tg://resolve\?domain=([a-zA-Z0-9_]{5,32})", re.IGNORECASE)
+    # All patterns run on the lowercased text, so they need no IGNORECASE
+    price_pattern = re.compile(r"(?:^|\D)(\d{2,7})\s?(?:₽|руб|р|rub)(?:\D|$)")
+    discount_pattern = re.compile(r"(?:(?:-|скидк\w*|к[еэ]шб[еэ]к\w*|cashback)\s*(?:до\s*)?)?(\d{1,2})\s?%")
+    mention_account_pattern = re.compile(r"@([a-z0-9_]{5,32})")
+    tme_account_pattern = re.compile(r"(?:https?://)?(?:t|telegram)\.me/([a-z0-9_]{5,32})")
+    tg_domain_pattern = re.compile(r"tg://resolve\?domain=([a-z0-9_]{5,32})")
 
     def __init__(
         self,
-        include_keywords: list[str],
-        exclude_keywords: list[str],
+        include_keywords: Sequence[str],
+        exclude_keywords: Sequence[str],
         min_score: int,
-        blacklisted_accounts: list[str] | None = None,
+        blacklisted_accounts: Sequence[str] | None = None,
+        price_tiers: Sequence[ScoreTier] = (),
+        discount_tiers: Sequence[ScoreTier] = (),
     ) -> None:
-        self.include_keywords = [k.lower() for k in include_keywords]
-        self.exclude_keywords = [k.lower() for k in exclude_keywords]
+        self.include_keywords = tuple(dict.fromkeys(k.lower() for k in include_keywords))
+        self.exclude_keywords = tuple(dict.fromkeys(k.lower() for k in exclude_keywords))
+        self._include_re = compile_keywords(self.include_keywords)
+        self._exclude_re = compile_keywords(self.exclude_keywords)
         self.min_score = min_score
+        self._price_thresholds, self._price_points, self._price_labels = split_tiers(price_tiers)
+        self._discount_thresholds, self._discount_points, self._discount_labels = split_tiers(discount_tiers)
+        # Best case the later stages can still add, used to stop scoring early
+        self._max_price_score = max(self._price_points)
+        self._max_discount_score = max(self._discount_points)
         self.blacklisted_accounts = {
             account.strip().lstrip("@").lower()
             for account in (blacklisted_accounts or [])
             if account.strip()
         }
 
-    def _extract_accounts(self, text: str) -> set[str]:
+    def _extract_accounts(self, normalized: str) -> set[str]:
         found: set[str] = set()
         for pattern in (
             self.mention_account_pattern,
             self.tme_account_pattern,
             self.tg_domain_pattern,
         ):
-            found.update(value.lower() for value in pattern.findall(text))
+            found.update(pattern.findall(normalized))
         return found
 
-    def match(self, text: str | None) -> MatchResult:
+    def match(self, text: str | None, normalized: str | None = None) -> MatchResult:
         if not text:
-            return MatchResult(is_interesting=False, score=0, reasons=["empty_text"])
+            return EMPTY_TEXT_RESULT
 
-        normalized = text.lower()
+        if normalized is None:
+            normalized = text.lower()
         reasons: list[str] = []
         score = 0
 
         if self.blacklisted_accounts:
-            mentioned_accounts = self._extract_accounts(text)
+            mentioned_accounts = self._extract_accounts(normalized)
             matched_blacklisted = sorted(mentioned_accounts & self.blacklisted_accounts)
             if matched_blacklisted:
                 return MatchResult(
                     is_interesting=False,
                     score=0,
-                    reasons=[f"blacklisted_account:{','.join(matched_blacklisted)}"],
+                    reasons=(f"blacklisted_account:{','.join(matched_blacklisted)}",),
                 )
 
-        if any(k in normalized for k in self.exclude_keywords):
-            return MatchResult(is_interesting=False, score=0, reasons=["exclude_keyword"])
+        if self._exclude_re and self._exclude_re.search(normalized):
+            return EXCLUDE_RESULT
 
-        matched_include = [k for k in self.include_keywords if k in normalized]
-        if matched_include:
+        if self._include_re and self._include_re.search(normalized):
+            # The alternation only reports one of overlapping keywords, so list them per keyword
+            matched_include = [k for k in self.include_keywords if k in normalized]
             score += 1
-            reasons.append(f"include_keywords:{','.join(sorted(set(matched_include)))}")
-
-        prices = [int(raw) for raw in self.price_pattern.findall(text)]
-        if prices:
-            max_price = max(prices)
-            if max_price >= 500 and max_price < 1000:
-                score += 1
-                reasons.append(f"low_price:{max_price}")
-            if max_price >= 1000 and max_price < 1500:
-                score += 2
-                reasons.append(f"low_price:{max_price}")
-            elif max_price >= 1500 and  max_price < 2500:
-                score += 3
-                reasons.append(f"mid_price:{max_price}")
-            elif max_price >= 2500 and max_price < 3500:
-                score += 4
-                reasons.append(f"big_price:{max_price}")
-            elif max_price >= 3500:
-                score += 5
-                reasons.append(f"biggest_price:{max_price}")
-
-        discount_match = self.discount_pattern.search(text)
+            reasons.append(f"include_keywords:{','.join(sorted(matched_include))}")
+
+        if score + self._max_price_score + self._max_discount_score < self.min_score:
+            return MatchResult(is_interesting=False, score=score, reasons=tuple(reasons))
+
+        max_price: int | None = None
+        for price_match in self.price_pattern.finditer(normalized):
+            price = int(price_match.group(1))
+            if max_price is None or price > max_price:
+                max_price = price
+        if max_price is not None:
+            index = bisect_right(self._price_thresholds, max_price)
+            if index:
+                score += self._price_points[index]
+                reasons.append(f"{self._price_labels[index]}:{max_price}")
+
+        if score + self._max_discount_score < self.min_score:
+            return MatchResult(is_interesting=False, score=score, reasons=tuple(reasons))
+
+        discount_match = self.discount_pattern.search(normalized)
         if discount_match:
             discount = int(discount_match.group(1))
-            if discount <= 30:
-                score += 1
-                reasons.append(f"lowest_discount:{discount}")
-            elif discount > 30 and discount <= 50:
-                score += 2
-                reasons.append(f"low_discount:{discount}")
-            elif discount > 50 and discount <= 80:
-                score += 3
-                reasons.append(f"mid_discount:{discount}")
-            elif discount > 80:
-                score += 4
-                reasons.append(f"big_discount:{discount}")
+            index = bisect_right(self._discount_thresholds, discount)
+            if index:
+                score += self._discount_points[index]
+                reasons.append(f"{self._discount_labels[index]}:{discount}")
 
         is_interesting = score >= self.min_score
-        return MatchResult(is_interesting=is_interesting, score=score, reasons=reasons)
+        return MatchResult(is_interesting=is_interesting, score=score, reasons=tuple(reasons))